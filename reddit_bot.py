@@ -1,12 +1,23 @@
 import praw
+import ahocorasick
+import argparse
+import logging
 import os
 import smtplib
 import time
 import json
 import re
-from email.mime.text import MIMEText
-from datetime import datetime, timedelta
 import sys
+from collections import deque
+from email.mime.text import MIMEText
+from datetime import datetime
+
+try:
+    # Faster JSON (de)serialization for the seen posts file; fall back to the
+    # standard library if it is not installed
+    import orjson
+except ImportError:
+    orjson = None
 
 # --------------------- CONFIGURATION ---------------------
 GAMES = [
@@ -26,85 +37,223 @@ SEEN_FILE = "seen_posts.json"
 # that might still appear in the 'new' feed over multiple runs.
 MAX_POSTS_TRACKED = 1000
 FLUSH_INTERVAL_DAYS = 2
+# Whether post bodies are searched for "switch" and game names, or only titles.
+# Titles-only skips most of the text per post; the selftext count logged
+# with each batch of matches shows what would be missed by turning this off.
+SCAN_SELFTEXT = True
+# Stop fetching once this many consecutive posts have already been processed,
+# since the 'new' listing only gets older from there.
+SEEN_STREAK_LIMIT = 25
+# Stop fetching at posts created this many seconds before the newest post processed
+# by a previous run. The slack covers posts that show up in 'new' late (e.g. after
+# moderator approval); anything inside it is still deduplicated by ID.
+HIGH_WATER_GRACE_SECONDS = 3600
+# Seconds to wait between scans when running with --daemon
+DAEMON_INTERVAL_SECONDS = 300
 
 EMAIL_SENDER = os.getenv("EMAIL_SENDER")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 EMAIL_RECEIVER = os.getenv("EMAIL_RECEIVER")
+# EMAIL_RECEIVER may hold several comma-separated addresses
+EMAIL_RECEIVERS = [addr.strip() for addr in (EMAIL_RECEIVER or "").split(",") if addr.strip()]
 
-def log_status(message):
-    """Logs a status message with a timestamp."""
-    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}")
+logger = logging.getLogger("gamesalebot")
 
-def create_regex_pattern(game_name):
+# SMTP connection kept open between sends (see get_smtp_server)
+_smtp_server = None
+
+def create_regex_pattern(game_names):
     """
-    Creates a regex pattern for a game name, allowing for optional apostrophes
-    and ensuring whole word matching.
+    Creates a single regex pattern matching any of the game names, allowing for
+    optional apostrophes and ensuring whole word matching. The pattern is
+    case-sensitive and expects already lowercased text.
     """
-    # Escape special regex chars except apostrophe
-    escaped = re.escape(game_name)
-    # Replace escaped apostrophe \' with regex group allowing apostrophe or nothing
-    pattern = escaped.replace("\\'", "['’]?")
+    fragments = []
+    for game_name in game_names:
+        # Escape special regex chars (re.escape leaves the apostrophe untouched)
+        escaped = re.escape(game_name.lower())
+        # Replace apostrophe with regex group allowing apostrophe or nothing
+        fragments.append(escaped.replace("'", "['’]?"))
     # Word boundaries for whole word matching
-    return re.compile(r"\b" + pattern + r"\b", re.IGNORECASE)
+    return re.compile(r"\b(?:" + "|".join(fragments) + r")\b")
+
+def strip_apostrophes(text):
+    """Removes straight and curly apostrophes so spelling variants compare equal."""
+    return text.replace("’", "").replace("'", "")
+
+def build_game_automaton(games):
+    """
+    Builds an Aho-Corasick automaton over the lowercased, apostrophe-free game
+    names so that a single pass over the (equally normalized) post content
+    finds every candidate game.
+    """
+    automaton = ahocorasick.Automaton()
+    for game in games:
+        automaton.add_word(strip_apostrophes(game.lower()), game)
+    automaton.make_automaton()
+    return automaton
+
+def new_seen_data(last_flushed, ids=(), last_seen_utc=0):
+    """
+    Builds the in-memory seen posts data. IDs live in a deque bounded to
+    MAX_POSTS_TRACKED, which evicts the oldest on append, plus a companion
+    set for O(1) membership tests. last_seen_utc is the creation time of the
+    newest post processed so far.
+    """
+    ids = deque(ids, maxlen=MAX_POSTS_TRACKED)
+    return {
+        "last_flushed": last_flushed,
+        "ids": ids,
+        "id_set": set(ids),
+        "last_seen_utc": last_seen_utc
+    }
+
+def remember_post(data, post_id):
+    """Adds a post ID to the seen posts data, evicting the oldest if full."""
+    ids = data["ids"]
+    if len(ids) == ids.maxlen:
+        data["id_set"].discard(ids[0])
+    ids.append(post_id)
+    data["id_set"].add(post_id)
+
+def contains_game(text, game_automaton, game_pattern):
+    """
+    Checks lowercased text for any game name. The automaton scans the text
+    once for all names, and only if it finds one is a whole-word match
+    confirmed with the combined regex. Apostrophes are stripped for the scan
+    so it accepts every spelling the regex does.
+    """
+    candidates = game_automaton.iter(strip_apostrophes(text))
+    return next(candidates, None) is not None and game_pattern.search(text) is not None
 
 def load_seen():
     """Loads the seen posts data from a JSON file."""
     try:
         if not os.path.exists(SEEN_FILE):
-            log_status("No seen posts file found. Creating new one.")
-            return {"last_flushed": str(datetime.now()), "ids": []}
-        with open(SEEN_FILE, "r") as f:
-            data = json.load(f)
-            log_status(f"Loaded seen posts data with {len(data.get('ids', []))} IDs.")
-            return data
+            logger.info("No seen posts file found. Creating new one.")
+            return new_seen_data(int(time.time()))
+        with open(SEEN_FILE, "rb") as f:
+            raw = f.read()
+        raw_data = orjson.loads(raw) if orjson else json.loads(raw)
+        last_flushed = raw_data.get("last_flushed", 0)
+        if isinstance(last_flushed, str):
+            # Older files stored an ISO timestamp instead of epoch seconds
+            last_flushed = int(datetime.fromisoformat(last_flushed).timestamp())
+        data = new_seen_data(
+            last_flushed,
+            raw_data.get("ids", []),
+            raw_data.get("last_seen_utc", 0)
+        )
+        logger.info("Loaded seen posts data with %d IDs.", len(data["ids"]))
+        return data
     except Exception as e:
-        log_status(f"Error loading seen posts data: {e}")
-        return {"last_flushed": str(datetime.now()), "ids": []}
+        logger.error("Error loading seen posts data: %s", e)
+        return new_seen_data(int(time.time()))
 
 def save_seen(data):
     """Saves the seen posts data to a JSON file."""
+    tmp_file = SEEN_FILE + ".tmp"
     try:
-        with open(SEEN_FILE, "w") as f:
-            json.dump(data, f)
-        log_status(f"Saved seen posts data with {len(data.get('ids', []))} IDs.")
+        # Encode up front so the file is written with a single call, then swap it
+        # into place so an interrupted run never leaves a truncated file behind
+        seen = {
+            "last_flushed": data["last_flushed"],
+            "ids": list(data["ids"]),
+            "last_seen_utc": data["last_seen_utc"]
+        }
+        if orjson:
+            payload = orjson.dumps(seen)
+        else:
+            payload = json.dumps(seen, separators=(",", ":")).encode()
+        with open(tmp_file, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_file, SEEN_FILE)
+        logger.info("Saved seen posts data with %d IDs.", len(data["ids"]))
     except Exception as e:
-        log_status(f"Error saving seen posts data: {e}")
+        logger.error("Error saving seen posts data: %s", e)
+        # Don't leave a partial temp file behind
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
 
 def flush_if_needed(data):
     """
     Checks if the seen posts data needs to be flushed based on FLUSH_INTERVAL_DAYS.
-    If so, it resets the seen IDs.
+    The seen IDs are kept: the deque already caps them at MAX_POSTS_TRACKED, and
+    clearing them would make the next scan re-notify matches it revisits inside
+    HIGH_WATER_GRACE_SECONDS. The last_seen_utc high-water mark is kept as well.
     """
     try:
-        last_flushed = datetime.fromisoformat(data.get("last_flushed"))
-        if datetime.now() - last_flushed > timedelta(days=FLUSH_INTERVAL_DAYS):
-            log_status("Flushing old seen posts data.")
-            data = {"last_flushed": str(datetime.now()), "ids": []}
+        # last_flushed is stored as epoch seconds
+        if time.time() - data["last_flushed"] > FLUSH_INTERVAL_DAYS * 86400:
+            logger.info("Flushing old seen posts data.")
+            data = new_seen_data(int(time.time()), data["ids"], data["last_seen_utc"])
             save_seen(data)
         else:
-            log_status("No flush needed at this time.")
+            logger.debug("No flush needed at this time.")
         return data
     except Exception as e:
-        log_status(f"Error checking flush time: {e}")
+        logger.error("Error checking flush time: %s", e)
         return data
 
+def get_smtp_server():
+    """
+    Returns a logged-in SMTP connection, reusing the previous one if the server
+    still answers a NOOP and reconnecting otherwise.
+    """
+    global _smtp_server
+    if _smtp_server is not None:
+        try:
+            if _smtp_server.noop()[0] == 250:
+                return _smtp_server
+        except smtplib.SMTPException:
+            pass
+        close_smtp_server()
+
+    server = smtplib.SMTP_SSL("smtp.gmail.com", 465)
+    try:
+        server.login(EMAIL_SENDER, EMAIL_PASSWORD)
+    except Exception:
+        # Don't leak the connection when the credentials are rejected
+        server.close()
+        raise
+    _smtp_server = server
+    return server
+
+def close_smtp_server():
+    """Closes the cached SMTP connection, if any."""
+    global _smtp_server
+    if _smtp_server is None:
+        return
+    try:
+        _smtp_server.quit()
+    except smtplib.SMTPException:
+        _smtp_server.close()
+    _smtp_server = None
+
 def send_email(subject, body):
-    """Sends an email notification."""
+    """
+    Sends an email notification as a single message to all receivers, letting
+    the SMTP server fan it out. Returns True if the message was sent.
+    """
     msg = MIMEText(body)
     msg["Subject"] = subject
     msg["From"] = EMAIL_SENDER
-    msg["To"] = EMAIL_RECEIVER
+    msg["To"] = ", ".join(EMAIL_RECEIVERS)
 
     try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(EMAIL_SENDER, EMAIL_PASSWORD)
-            server.send_message(msg)
-        log_status("Email sent successfully.")
+        get_smtp_server().send_message(msg, to_addrs=EMAIL_RECEIVERS)
+        logger.info("Email sent successfully.")
+        return True
     except Exception as e:
-        log_status(f"Failed to send email: {e}")
+        logger.error("Failed to send email: %s", e)
+        # Drop the connection so the next send starts from a fresh one
+        close_smtp_server()
+        return False
 
 def init_reddit():
-    """Initializes and authenticates the PRAW Reddit client."""
+    """Initializes the PRAW Reddit client."""
     try:
         reddit = praw.Reddit(
             client_id=os.getenv("CLIENT_ID"),
@@ -113,95 +262,187 @@ def init_reddit():
             password=os.getenv("PASSWORD"),
             user_agent="GameSaleBot v1.0"
         )
-        # Test authentication by getting the current user
-        reddit.user.me()
-        log_status("Reddit authentication successful.")
+        # No test request here: authentication errors surface on the first
+        # listing fetch, which is wrapped in run_once()'s error handling
+        logger.info("Reddit client initialized.")
         return reddit
     except Exception as e:
-        log_status(f"Error initializing Reddit client: {e}")
+        logger.error("Error initializing Reddit client: %s", e)
         raise # Re-raise the exception to stop execution if Reddit init fails
 
+def run_once(reddit, seen_data, game_automaton, game_pattern):
+    """
+    Scans the newest subreddit posts once and emails any matches.
+    Returns True if seen_data was modified and needs to be saved.
+    """
+    try:
+        subreddit = reddit.subreddit(SUBREDDIT)
+        matches = []
+        selftext_matches = 0
+        new_ids = []
+        newest_utc = seen_data["last_seen_utc"]
+        cutoff_utc = newest_utc - HIGH_WATER_GRACE_SECONDS
+
+        logger.info("Fetching last %d posts from r/%s.", MAX_POSTS_TRACKED, SUBREDDIT)
+
+        consecutive_seen = 0
+        # Fetch posts up to MAX_POSTS_TRACKED to ensure we cover a wide enough window.
+        # PRAW requests the listing one page (100 posts) at a time, so the seen-streak
+        # and high-water breaks below usually stop it after the first request.
+        for post in subreddit.new(limit=MAX_POSTS_TRACKED):
+            # 'new' is ordered newest first, so once posts predate the high-water
+            # mark everything after them was handled by an earlier run
+            if post.created_utc < cutoff_utc:
+                logger.debug("Reached posts older than the previous run. Stopping fetch.")
+                break
+
+            # Skip if the post has already been seen, and stop paging once we
+            # reach a run of posts that were all processed previously
+            if post.id in seen_data["id_set"]:
+                consecutive_seen += 1
+                if consecutive_seen >= SEEN_STREAK_LIMIT:
+                    logger.debug("Reached %d already seen posts. Stopping fetch.", consecutive_seen)
+                    break
+                continue
+            consecutive_seen = 0
+            new_ids.append(post.id)
+            newest_utc = max(newest_utc, post.created_utc)
+
+            # --- CONDITION: Check if "switch" is in the post content ---
+            # Game matching is only done if the post contains the word "switch".
+            # The title is checked first so selftext is only lowercased when needed,
+            # and at most once per post.
+            title_lower = post.title.lower()
+            title_has_switch = "switch" in title_lower
+            selftext_lower = None
+            if not title_has_switch:
+                if not SCAN_SELFTEXT:
+                    continue
+                # Ensure selftext is not None before converting to lower
+                selftext_lower = (post.selftext or "").lower()
+                if "switch" not in selftext_lower:
+                    # If "switch" is not present, skip this post entirely
+                    continue
+            # --- END CONDITION ---
+
+            # Title and selftext are matched separately rather than joined into
+            # one string, and selftext is skipped when the title already matches
+            if contains_game(title_lower, game_automaton, game_pattern):
+                matches.append((post.title, post.url))
+                if not title_has_switch:
+                    selftext_matches += 1
+                continue
+            if not SCAN_SELFTEXT:
+                continue
+            if selftext_lower is None:
+                selftext_lower = (post.selftext or "").lower()
+            if contains_game(selftext_lower, game_automaton, game_pattern):
+                matches.append((post.title, post.url))
+                selftext_matches += 1
+
+        # All matches go out in one email, and the SMTP connection is only
+        # opened once the scan has finished and found something to send
+        if matches:
+            subject = f"[GameSaleBot] {len(matches)} match(es) found!"
+            body = f"Found {len(matches)} matching post(s):\n\n"
+            body += "\n\n".join([f"{title}\n{url}" for title, url in matches])
+            if not send_email(subject, body):
+                # Leave this scan's posts unrecorded and the high-water mark
+                # where it was, so the next scan finds and retries these matches
+                logger.warning("Found %d matches but the email failed. Will retry next run.", len(matches))
+                return False
+            logger.info("Found %d matches. Notification email sent.", len(matches))
+            if SCAN_SELFTEXT:
+                logger.info("%d of %d matches needed the post selftext.", selftext_matches, len(matches))
+        else:
+            logger.info("No matches found this run.")
+
+        # Record every processed post, matching or not, so later runs can
+        # skip it and detect where they caught up with this one. This only
+        # happens once the scan completed and any matches were emailed, so an
+        # error never hides a match.
+        for post_id in new_ids:
+            remember_post(seen_data, post_id)
+        seen_data["last_seen_utc"] = newest_utc
+        return bool(new_ids)
+
+    except Exception as e:
+        logger.error("Error during subreddit processing: %s", e)
+        return False
+
+def positive_int(value):
+    """argparse type for an integer of at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 def main():
     """Main function to run the Reddit bot."""
-    # Delete seen file on manual run:
-    # Check if script run with 'manual' argument or via env variable
-    manual_run = False
-    if len(sys.argv) > 1 and sys.argv[1].lower() == "manual":
-        manual_run = True
+    parser = argparse.ArgumentParser(description="Watch r/" + SUBREDDIT + " for game sale posts.")
+    # Like the original sys.argv check, 'manual' is case-insensitive and any
+    # other positional value just means a regular run
+    parser.add_argument("mode", nargs="?", type=str.lower,
+                        help="'manual' deletes the seen posts file before scanning")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and rescan every --interval seconds")
+    parser.add_argument("--interval", type=positive_int, default=DAEMON_INTERVAL_SECONDS,
+                        help=f"seconds between scans in daemon mode (default: {DAEMON_INTERVAL_SECONDS})")
+    args = parser.parse_args()
+
+    # Delete seen file on manual run
+    manual_run = args.mode == "manual"
 
     if manual_run:
         if os.path.exists(SEEN_FILE):
             try:
                 os.remove(SEEN_FILE)
-                log_status("Manual run detected - deleted seen posts file.")
+                logger.info("Manual run detected - deleted seen posts file.")
             except Exception as e:
-                log_status(f"Error deleting seen file on manual run: {e}")
+                logger.error("Error deleting seen file on manual run: %s", e)
 
     try:
         reddit = init_reddit()
     except Exception:
-        log_status("Aborting bot run due to Reddit initialization failure.")
+        logger.error("Aborting bot run due to Reddit initialization failure.")
         return
 
     seen_data = load_seen()
-    seen_data = flush_if_needed(seen_data)
 
-    # Compile regex patterns for all games once
-    game_patterns = [(game, create_regex_pattern(game)) for game in GAMES]
+    # Build the keyword automaton and compile the combined regex pattern once
+    game_automaton = build_game_automaton(GAMES)
+    game_pattern = create_regex_pattern(GAMES)
 
     try:
-        subreddit = reddit.subreddit(SUBREDDIT)
-        matches = []
-
-        # Corrected log message to reflect the actual limit used
-        log_status(f"Fetching last {MAX_POSTS_TRACKED} posts from r/{SUBREDDIT}.")
-
-        # Fetch posts up to MAX_POSTS_TRACKED to ensure we cover a wide enough window
-        for post in subreddit.new(limit=MAX_POSTS_TRACKED):
-            # Skip if the post has already been seen
-            if post.id in seen_data["ids"]:
-                continue
-
-            # Combine title and selftext for content search
-            # Ensure selftext is not None before converting to lower
-            content = (post.title + " " + (post.selftext or "")).lower()
-
-            # --- CONDITION: Check if "switch" is in the post content ---
-            # Game matching is only done if the post contains the word "switch"
-            if "switch" not in content:
-                # If "switch" is not present, skip this post entirely
-                continue
-            # --- END CONDITION ---
-            
-            # Iterate through defined game patterns to find a match
-            for game, pattern in game_patterns:
-                if pattern.search(content):
-                    matches.append((post.title, post.url))
-                    seen_data["ids"].append(post.id)
-                    # Keep the seen_ids list to a manageable size.
-                    # This truncation happens *after* a new ID is added, ensuring the most recent
-                    # MAX_POSTS_TRACKED unique IDs are kept.
-                    if len(seen_data["ids"]) > MAX_POSTS_TRACKED:
-                        seen_data["ids"] = seen_data["ids"][-MAX_POSTS_TRACKED:]
-                    break # Stop checking other games for this post once a match is found
+        while True:
+            seen_data = flush_if_needed(seen_data)
 
-        if matches:
-            subject = f"[GameSaleBot] {len(matches)} match(es) found!"
-            body = f"Found {len(matches)} matching post(s):\n\n"
-            body += "\n\n".join([f"{title}\n{url}" for title, url in matches])
-            send_email(subject, body)
-            log_status(f"Found {len(matches)} matches. Notification email sent.")
-        else:
-            log_status("No matches found this run.")
+            # Only rewrite the seen posts file when this scan changed it
+            if run_once(reddit, seen_data, game_automaton, game_pattern):
+                save_seen(seen_data)
 
-        # Save the updated seen posts data
-        save_seen(seen_data)
-
-    except Exception as e:
-        log_status(f"Error during subreddit processing: {e}")
+            if not args.daemon:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        logger.info("Daemon stopped.")
+    finally:
+        close_smtp_server()
 
 if __name__ == "__main__":
+    # LOG_LEVEL=WARNING (or higher) silences the per-run status messages
+    log_level_name = os.getenv("LOG_LEVEL", "INFO").upper()
+    # getLevelName() returns the numeric level for known names, a string otherwise
+    log_level = logging.getLevelName(log_level_name)
+    logging.basicConfig(
+        level=log_level if isinstance(log_level, int) else logging.INFO,
+        format="[%(asctime)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        stream=sys.stdout
+    )
+    if not isinstance(log_level, int):
+        logger.warning("Unknown LOG_LEVEL %r, using INFO.", log_level_name)
     start_time = time.time()
-    log_status("Bot started.")
+    logger.info("Bot started.")
     main()
-    log_status(f"Bot finished. Execution time: {time.time() - start_time:.2f} seconds")
+    logger.info("Bot finished. Execution time: %.2f seconds", time.time() - start_time)